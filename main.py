@@ -3,7 +3,6 @@
 @author: Tommaso Giacometti
 """
 from protein_class import Protein
-import random
 import time
 import configparser
 import argparse
@@ -27,7 +26,7 @@ configuration.read(filename)
 config = utils.Configuration(configuration) # class to get the save the configuration from the file
 
 #Random seed setting
-random.seed(config.seed)
+utils.set_seed(config.seed)
 print(f'The random seed used is {config.seed}')
 
 prot = Protein(config) # Protein class 
@@ -38,7 +37,12 @@ start = time.time()
 
 print('--------------------')
 print('Evolution started...')
-prot.evolution() # evolve the protein with folds foldings
+if config.pt:
+    print('Parallel tempering: the replicas run in parallel, the run is not reproducible with the seed')
+    rate = prot.parallel_tempering(config.pt_temps, config.folds//config.pt_swap_interval, config.pt_swap_interval)
+    print(f'Accepted exchanges between replicas: {rate:.1%}')
+else:
+    prot.evolution() # evolve the protein with folds foldings
 print('Evolution ended')
 print('---------------')
 
@@ -46,8 +50,9 @@ print('---------------')
 plots.view(protein=prot, save=False, tit='Final configuration')
 plots.view_min_en(protein=prot)
 plots.view_max_comp(protein=prot)
-plots.plot_energy(protein=prot, avg=10)
-plots.plot_compactness(protein=prot, avg=10)
+avg = 1 if config.pt else 10 # with parallel tempering the history has one entry per sweep
+plots.plot_energy(protein=prot, avg=avg)
+plots.plot_compactness(protein=prot, avg=avg)
 
 print(f'It took {time.time()-start:.3f} seconds')
 
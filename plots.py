@@ -8,6 +8,39 @@ from matplotlib.animation import PillowWriter
 import numpy as np
 import utils
 
+def _draw_struct(ax, struct, is_h, en = None, comp = None) -> None:
+    '''
+    Draw a protein structure on the matplotlib axes: the backbone and one scatter for each type of monomer (H/P).
+    If given, energy and (normalized) compactness are written in the top left corner.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        Axes where to draw the structure.
+    struct : np.ndarray
+        Structure of the protein.
+    is_h : np.ndarray
+        Boolean mask of the H monomers in the sequence.
+    en : float, optional
+        Energy of the structure. The default is None.
+    comp : float, optional
+        Normalized compactness of the structure. The default is None.
+    '''
+    x = struct[:,0] # x coordinates of the monomers (ordered)
+    y = struct[:,1] # y coordinates of the monomers (ordered)
+
+    ax.plot(x,y, alpha = 0.5)
+    ax.scatter(x[is_h], y[is_h], marker='$H$', s=20, color = 'red')
+    ax.scatter(x[~is_h], y[~is_h], marker='$P$', s=20, color = 'red')
+    ax.set_xlim(x.min()-6, x.max()+6)
+    ax.set_ylim(y.min()-6, y.max()+6)
+    ax.grid(alpha=0.2)
+    if en is not None:
+        ax.text(0.01,0.99, f'Energy: {en}', ha='left', va='top', transform=ax.transAxes)
+    if comp is not None:
+        ax.text(0.01,0.95, f'Compactness: {comp:.2f}', ha='left', va='top', transform=ax.transAxes)
+
+
 def view(protein : Protein, save = True, tit = None):
     '''
     Function to plot the protein structure with matplotlib.
@@ -15,27 +48,11 @@ def view(protein : Protein, save = True, tit = None):
     Title can be optionally inserted.
     If save == True the plot will be also saved as pdf.
     '''
-    x = [] # x coordinates of the monomers (ordered)
-    y = [] # y coordinates of the monomers (ordered)
-    
     fig, ax = plt.subplots()
-    for i in range(protein.n):
-        x.append(protein.struct[i][0])
-        y.append(protein.struct[i][1])    
-    ax.plot(x,y, alpha = 0.5)
-    for i, coord in enumerate(protein.struct):
-        ax.scatter(x[i], y[i], marker='$'+protein.seq[i]+'$', s=20, color = 'red')
-    ax.set_xlim(min(x)-6,max(x)+6)
-    ax.set_ylim(min(y)-6,max(y)+6)
-    ax.grid(alpha=0.2)
+    en, comp = protein.energy_and_compactness()
+    _draw_struct(ax, protein.struct, protein.is_h, en, comp/(protein.max_comp+10e-15)) # the +10e-15 is used for numerical stability (avoid division by 0)
     if tit is not None:
         ax.set_title(tit)
-    en = protein.energy()
-    comp = protein.compactness()
-    string = f'Energy: {en}'
-    string_comp = f'Compactness: {comp/(max(protein.comp_evo)+10e-15):.2f}' # the +10e-15 is used for numerical stability (avoid division by 0)
-    ax.text(0.01,0.99, string, ha='left', va='top', transform=ax.transAxes)
-    ax.text(0.01,0.95, string_comp, ha='left', va='top', transform=ax.transAxes)
     plt.show(block=False)
     if save:
         plt.savefig("data/prot_view.png", format="png", bbox_inches="tight", dpi = 200)
@@ -47,25 +64,9 @@ def view_min_en(protein, save = True):
     As first argument the protein class instance of the desired protein is needed.
     The plot can be saved with save = True as pdf
     '''
-    x = [] # x coordinates of the monomers (ordered)
-    y = [] # y coordinates of the monomers (ordered)
-    
     fig, ax = plt.subplots()
-    for i in range(protein.n):
-        x.append(protein.min_en_struct[i][0])
-        y.append(protein.min_en_struct[i][1])    
-    ax.plot(x,y, alpha = 0.5)
-    for i, coord in enumerate(protein.struct):
-        ax.scatter(x[i], y[i], marker='$'+protein.seq[i]+'$', s=20, color = 'red')
-    ax.set_xlim(min(x)-6,max(x)+6)
-    ax.set_ylim(min(y)-6,max(y)+6)
-    ax.grid(alpha=0.2)
-    en = min(protein.en_evo)
-    comp = protein.comp_evo[protein.en_evo.index(en)]
-    string = f'Energy: {en}'
-    string_comp = f'Compactness: {comp/(max(protein.comp_evo)+10e-15):.2f}' # + 10e-15 for numerical stability (avoid division by 0)
-    ax.text(0.01,0.99, string, ha='left', va='top', transform=ax.transAxes)
-    ax.text(0.01,0.95, string_comp, ha='left', va='top', transform=ax.transAxes)
+    en, comp = protein.energy_and_compactness(struct=protein.min_en_struct) # the structure may come from parallel_tempering, which has no history
+    _draw_struct(ax, protein.min_en_struct, protein.is_h, en, comp/(protein.max_comp+10e-15)) # + 10e-15 for numerical stability (avoid division by 0)
     ax.set_title('Min energy structure')
     plt.show(block=False)
     if save:
@@ -79,26 +80,10 @@ def view_max_comp(protein, save = True):
     The plot can be saved with save = True as pdf
 
     '''
-    x = [] # x coordinates of the monomers (ordered)
-    y = [] # y coordinates of the monomers (ordered)
-    
     fig, ax = plt.subplots()
-    for i in range(protein.n):
-        x.append(protein.max_comp_struct[i][0])
-        y.append(protein.max_comp_struct[i][1])    
-    ax.plot(x,y, alpha = 0.5)
-    for i, coord in enumerate(protein.struct):
-        ax.scatter(x[i], y[i], marker='$'+protein.seq[i]+'$', s=20, color = 'red')
-    ax.set_xlim(min(x)-6,max(x)+6)
-    ax.set_ylim(min(y)-6,max(y)+6)
-    ax.grid(alpha=0.2)
+    en, comp = protein.energy_and_compactness(struct=protein.max_comp_struct) # the structure may come from parallel_tempering, which has no history
+    _draw_struct(ax, protein.max_comp_struct, protein.is_h, en, comp/(protein.max_comp+10e-15)) # the +10e-15 is used for numerical stability (avoid division by 0)
     ax.set_title('Max compactness structure')
-    comp = max(protein.comp_evo)
-    en = protein.en_evo[protein.comp_evo.index(comp)]
-    string = f'Energy: {en}'
-    string_comp = f'Compactness: {comp/(max(protein.comp_evo)+10e-15):.2f}' # the +10e-15 is used for numerical stability (avoid division by 0)
-    ax.text(0.01,0.99, string, ha='left', va='top', transform=ax.transAxes)
-    ax.text(0.01,0.95, string_comp, ha='left', va='top', transform=ax.transAxes)
     plt.show(block=False)
     if save:
         plt.savefig("data/max_compactness_view.png", format="png", bbox_inches="tight", dpi = 200)
@@ -120,14 +105,10 @@ def plot_energy(protein, avg : int = 1, save = True) -> None:
     -------
     Plot
     '''
-    en_evo = np.array(protein.en_evo[1:].copy())
-    T = np.array(protein.T[1:])
-    x = np.arange(0, len(en_evo), avg)
-    try:
-        en_evo = en_evo.reshape(-1,avg).mean(axis=1)
-        T = T.reshape(-1,avg).mean(axis=1)
-    except:
-        print(f'Mean procedure skipped since the number of time steps is not a multiple of the avarage required: {avg}')
+    k = (len(protein.en_evo)-1)//avg*avg # the last steps that don't fill a group of avg are not plotted
+    en_evo = protein.en_evo[1:k+1].reshape(-1,avg).mean(axis=1)
+    T = protein.T[1:k+1].reshape(-1,avg).mean(axis=1)
+    x = np.arange(0, k, avg)
     fig, ax = plt.subplots()
     ax.set_title(f'Energy evolution of the system averaged by {avg} time steps')
     ax.set_xlabel('Time step')
@@ -159,15 +140,10 @@ def plot_compactness(protein, avg : int = 1, save = True) -> None:
     -------
     Plot
     '''
-    comp = np.array(protein.comp_evo[1:].copy())
-    comp = comp/max(comp)
-    T = np.array(protein.T[1:])
-    x = np.arange(0, len(comp), avg)
-    try:
-        comp = comp.reshape(-1,avg).mean(axis=1)
-        T = T.reshape(-1,avg).mean(axis=1)
-    except:
-        print(f'Mean procedure skipped since the number of time steps is not a multiple of the avarage required: {avg}')
+    k = (len(protein.comp_evo)-1)//avg*avg # the last steps that don't fill a group of avg are not plotted
+    comp = protein.comp_evo[1:k+1].reshape(-1,avg).mean(axis=1)/(protein.comp_evo.max()+10e-15) # normalized by the max of the plotted history, + 10e-15 for numerical stability (avoid division by 0)
+    T = protein.T[1:k+1].reshape(-1,avg).mean(axis=1)
+    x = np.arange(0, k, avg)
     fig, ax = plt.subplots()
     ax.set_title(f'Compactness evolution of the system averaged by {avg} time steps')
     ax.set_xlabel('Time step')
@@ -196,29 +172,30 @@ def create_gif(protein):
     print('Creating gif...')
 
     fig, ax = plt.subplots()
+    is_h = protein.is_h
+
+    # the artists are created once and only their data is updated at each frame
+    line, = ax.plot([], [], alpha = 0.5)
+    h_scat = ax.scatter([], [], marker='$H$', s=20, color = 'red')
+    p_scat = ax.scatter([], [], marker='$P$', s=20, color = 'red')
+    ax.grid(alpha=0.2)
 
     writer =  PillowWriter(fps=5)
 
-    with writer.saving(fig, 'data/evo.gif', 200):
+    with writer.saving(fig, 'data/evo.gif', 100):
 
         for i,structure in enumerate(protein.gif_struct):
             utils.progress_bar(i+1, len(protein.gif_struct))
 
-            x = []
-            y = []
-
-            for i in range(protein.n):
-                x.append(structure[i][0])
-                y.append(structure[i][1])
-            ax.plot(x,y, alpha = 0.5)
-            for i, coord in enumerate(structure):
-                ax.scatter(x[i], y[i], marker='$'+protein.seq[i]+'$', s=20, color = 'red')
-            ax.set_xlim(min(x)-6,max(x)+6)
-            ax.set_ylim(min(y)-6,max(y)+6)
-            ax.grid(alpha=0.2)
+            x = structure[:,0]
+            y = structure[:,1]
+            line.set_data(x, y)
+            h_scat.set_offsets(structure[is_h])
+            p_scat.set_offsets(structure[~is_h])
+            ax.set_xlim(x.min()-6, x.max()+6)
+            ax.set_ylim(y.min()-6, y.max()+6)
 
             writer.grab_frame()
-            ax.clear()
     
     print('Gif created')
     print('-----------')
\ No newline at end of file
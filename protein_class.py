@@ -4,9 +4,7 @@
 """
 import matplotlib.pyplot as plt
 from matplotlib.animation import PillowWriter
-import random
 import utils
-import math
 import numpy as np
 
 
@@ -41,10 +39,7 @@ class Protein():
                 assert len(config.struct) == self.n
             except:
                 raise AssertionError('The lengths of the sequence and the structure are not the same')
-            self.struct = config.struct
-        
-        if not utils.is_valid_struct(self.struct): # check that the sequence is valid
-            raise AssertionError('The structure is not a self avoid walk (SAW) or the distances between consecutive points are different from 1')
+            self.struct = config.struct # the structure is checked by the setter before it is used
         
         # parameters setting
         self.annealing = config.annealing
@@ -52,13 +47,62 @@ class Protein():
         self.steps = config.folds
         self.gif = config.gif
         self.gif_struct = []
+        self.local_prob = config.local_prob # probability to try a local move instead of a pivot move
+        self.crank_prob = config.crank_prob # probability of the crankshaft move when also the diagonal move is possible
+
+        self.min_en_struct = self.struct.copy() # variable to record the min energy structure (for now is the only structure)
+        en, comp = self.energy_and_compactness()
+        self.en_evo = np.array([en]) # array to keep track of the energy evolution
+        self.T = np.empty(0) # array to keep track of the temperature evolution
+        self.counter = np.empty(0, dtype=np.int64) # counter of number of folding per step
+        self.comp_evo = np.array([comp], dtype=np.int64) # array to keep track of the compactness evolution
+        self.max_comp_struct = self.struct.copy() # variable to record the max compact structure (for now is the only structure)
+        self.min_en = self.en_evo[0] # min energy found (updated during the evolution without scanning en_evo)
+        self.max_comp = self.comp_evo[0] # max compactness found (updated during the evolution without scanning comp_evo)
+
+
+    @property
+    def seq(self) -> str:
+        '''
+        HP sequence of the protein.\n
+        When a new sequence is assigned also the mask of the H monomers (self.is_h) is updated.
+        '''
+        return self._seq
+
+
+    @seq.setter
+    def seq(self, seq : str) -> None:
+        self._seq = seq
+        self.is_h = np.frombuffer(seq.encode('ascii'), dtype=np.uint8) == ord('H') # boolean mask of the H monomers
+
+
+    @property
+    def struct(self) -> np.ndarray:
+        '''
+        Structure of the protein: int32 array of shape (n,2) with the x and y coordinates of each monomer.\n
+        When a new structure is assigned it is checked to be valid and then the occupancy grid of the lattice (self.grid)
+        is updated, an AssertionError is raised if the structure is not valid (and nothing is changed).
+        '''
+        return self._struct
+
+
+    @struct.setter
+    def struct(self, struct) -> None:
+        struct = np.array(struct, dtype=np.int32).reshape(-1,2) # contiguous copy of the coordinates
+        if not utils.is_valid_struct(struct): # checked before the grid is touched, a valid structure always fits in the grid
+            raise AssertionError('The structure is not a self avoid walk (SAW) or the distances between consecutive points are different from 1')
+        n = len(struct)
 
-        self.min_en_struct = self.struct # variable to record the min energy structure (for now is the only structure)
-        self.en_evo = [self.energy()] # list to keep track of the energy evolution
-        self.T = [] # list to keep track of the temperature evolution
-        self.counter = [] # counter of number of folding per step
-        self.comp_evo = [self.compactness()] # list to keep track of the compactness evolution
-        self.max_comp_struct = self.struct # variable to record the max compact structure (for now is the only structure)
+        if hasattr(self, '_struct') and self.grid.shape[0] == 2*n+4:
+            self.grid[self._struct[:,0]+self.off[0], self._struct[:,1]+self.off[1]] = -1 # clear the cells of the previous structure
+        else:
+            # every monomer is at most n-1 steps far from the first one, so a (2n+4)x(2n+4) grid centered on it is enough
+            self.grid = np.full((2*n+4, 2*n+4), -1, dtype=np.int32)
+
+        self.off = (n+1) - struct[0] # offset from the lattice coordinates to the grid indices (the first monomer is never moved by the folds)
+        self.grid[struct[:,0]+self.off[0], struct[:,1]+self.off[1]] = np.arange(n, dtype=np.int32) # each cell contains the monomer position in the sequence (-1 if empty)
+        self._struct = struct
+        self._new_struct = np.empty_like(struct) # buffer for the new structures generated during the evolution
 
         
     def evolution(self):
@@ -76,41 +120,118 @@ class Protein():
         -------
         None.
         '''
-        T = self.T_in
-        self.T.append(T) # initial temperature
-        m = -T/self.steps # angolar coefficient for the annealing
-
-        for i in range(self.steps):
-            utils.progress_bar(i+1,self.steps) # print the progress bar of the evolution
-
-            if self.annealing and T > 0.002 : T = m*(i - self.steps) # temperature decrease linearly w.r.t. the steps, if annealing is True
-            en = self.energy() # current protein energy
-            init_str = self.struct # current protein structure
-            self.struct = self.random_fold() # new structure is generated
-            new_en = self.energy() # the energy of the new structure is computed
-            
-            if new_en > en: # if the new energy is higher to the previus one, the new structure is accepted following the Metropolis alg
-                d_en = new_en - en # energy difference of the two states
-                r = random.uniform(0, 1)
-                p = math.exp(-d_en/T) # probability to accept the new structure
-                if r > p:
-                    self.struct = init_str # the new structure is not accepted (overwrite the initial structure)
-                    
-            if new_en < min(self.en_evo): # to save the min enrergy and structure
-                self.min_en_struct = self.struct
-            self.en_evo.append(new_en) # record the energy evolution
-
-            self.comp_evo.append(self.compactness()) # save the compactness
-            if self.comp_evo[-1] > max(self.comp_evo[:-1]):
-                self.max_comp_struct = self.struct
-
-            self.T.append(T) # record the T evolution
+        steps = self.steps
+        T = np.full(steps+1, self.T_in, dtype=np.float64) # temperature at each step (the first one is the initial temperature)
+        if self.annealing: # temperature decrease linearly w.r.t. the steps until it goes below 0.002
+            T[1:] = self.T_in*(steps - np.arange(steps))/steps
+            frozen = np.flatnonzero(T[1:] <= 0.002)
+            if frozen.size > 0:
+                T[frozen[0]+1:] = T[frozen[0]+1]
+
+        # the arrays of the evolution are preallocated (keeping the values of previous evolutions) and filled in place
+        k = len(self.en_evo)
+        kc = len(self.counter)
+        self.en_evo = np.concatenate((self.en_evo, np.empty(steps, dtype=np.float64)))
+        self.comp_evo = np.concatenate((self.comp_evo, np.empty(steps, dtype=np.int64)))
+        self.counter = np.concatenate((self.counter, np.empty(steps, dtype=np.int64)))
+        self.T = np.concatenate((self.T, T))
+
+        en, comp = self.energy_and_compactness() # current energy and compactness, then updated incrementally at each step
+        min_en, min_en_struct = self.min_en, self.struct.copy()
+        max_comp, max_comp_struct = self.max_comp, self.struct.copy()
+        chunk = max(1, steps//100) # steps run in each compiled call, between them the progress bar and the gif are updated
 
+        for start in range(0, steps, chunk):
+            stop = min(start + chunk, steps)
+            # compiled Metropolis steps: the structure and the occupancy grid are updated in place
+            en, comp, min_en, max_comp = utils.mc_evolution(self._struct, self._new_struct, self.grid, self.off, self.is_h,
+                                                            T[1+start:1+stop], en, comp, min_en, min_en_struct, max_comp,
+                                                            max_comp_struct, self.en_evo[k+start:k+stop],
+                                                            self.comp_evo[k+start:k+stop], self.counter[kc+start:kc+stop],
+                                                            self.local_prob, self.crank_prob)
+            utils.progress_bar(stop, steps) # print the progress bar of the evolution
             if self.gif:
-                if i%(int(self.steps/100)) == 0:
-                    self.gif_struct.append(self.struct)
+                self.gif_struct.append(self.struct.copy())
+
+        if min_en < self.min_en: # to save the min enrergy and structure
+            self.min_en = min_en
+            self.min_en_struct = min_en_struct
+        if max_comp > self.max_comp: # to save the max compactness and structure
+            self.max_comp = max_comp
+            self.max_comp_struct = max_comp_struct
     
     
+    def parallel_tempering(self, temps : list, sweeps : int, swap_interval : int = 100) -> float:
+        '''
+        Let the system evolve with the parallel tempering (replica exchange) method: a replica of the protein is
+        evolved at each temperature in temps, the replicas run in parallel on the available cores and every
+        swap_interval steps the replicas adjacent in temperature try to exchange their temperatures following the
+        Metropolis criterion.\n
+        The min energy and max compactness structures found by all the replicas are saved, at the end the structure of
+        the protein is the one of the replica at the lowest temperature.\n
+        After each sweep the energy, compactness and temperature of the coldest replica are appended to the evolution
+        history (one entry per sweep) and, if the gif is requested, its structure is saved about 100 times.\n
+        The replicas use the random generators of the parallel threads, so the run is not reproducible with the seed.
+
+        Parameters
+        ----------
+        temps : list
+            Temperatures of the replicas (one replica for each temperature).
+        sweeps : int
+            Number of sweeps, each one made of swap_interval steps for each replica followed by the exchange attempt.
+        swap_interval : int, optional
+            Number of steps between two exchange attempts. The default is 100.
+
+        Returns
+        -------
+        float
+            Fraction of the accepted exchanges over the attempted ones.
+        '''
+        T = np.array(temps, dtype=np.float64)
+        R = len(T)
+        structs = np.repeat(self.struct[None], R, axis=0) # all the replicas start from the current structure
+        grids = np.repeat(self.grid[None], R, axis=0)
+        en, comp = self.energy_and_compactness()
+        en = np.full(R, en)
+        comp = np.full(R, comp, dtype=np.int64)
+        min_en = en.copy()
+        min_en_structs = structs.copy()
+        max_comp = comp.copy()
+        max_comp_structs = structs.copy()
+
+        if len(self.T) == 0: # the starting temperature aligns the history as in evolution
+            self.T = np.array([T.min()])
+        k = len(self.en_evo)
+        self.en_evo = np.concatenate((self.en_evo, np.empty(sweeps, dtype=np.float64)))
+        self.comp_evo = np.concatenate((self.comp_evo, np.empty(sweeps, dtype=np.int64)))
+        self.T = np.concatenate((self.T, np.full(sweeps, T.min())))
+        gif_every = max(sweeps//100, 1) # about 100 frames for the gif
+        accepted = 0
+
+        for s in range(sweeps):
+            utils.progress_bar(s+1, sweeps)
+            utils.replicas_sweep(structs, grids, self.off, self.is_h, T, en, comp, min_en, min_en_structs,
+                                 max_comp, max_comp_structs, swap_interval, self.local_prob, self.crank_prob)
+            accepted += utils.replicas_swap(T, en)
+            c = np.argmin(T) # coldest replica
+            self.en_evo[k+s] = en[c]
+            self.comp_evo[k+s] = comp[c]
+            if self.gif and s % gif_every == 0:
+                self.gif_struct.append(structs[c].copy())
+
+        r = np.argmin(min_en)
+        if min_en[r] < self.min_en: # to save the min energy and structure
+            self.min_en = min_en[r]
+            self.min_en_struct = min_en_structs[r]
+        r = np.argmax(max_comp)
+        if max_comp[r] > self.max_comp: # to save the max compactness and structure
+            self.max_comp = max_comp[r]
+            self.max_comp_struct = max_comp_structs[r]
+
+        self.struct = structs[np.argmin(T)] # structure of the coldest replica
+        return accepted/max(sweeps*(R-1), 1)
+
+
     def energy(self, e = 1.) -> float:
         '''
         Function to compute the energy of the protein structure. The binding energy can be changed.
@@ -126,15 +247,7 @@ class Protein():
         float
             The energy of the protein structure.
         '''
-        count_h = 0 # counter of H-H neighbor pairs (exluding protein's backbone bonds)
-        
-        for i,seq in enumerate(self.seq):
-            if seq == 'H':
-                neig = self.get_neig_of(i) # string of neighbors of i-th monomer (exluding protein's backbone bonds)
-                count_h += neig.count('H') 
-        
-        tot_en = -e*count_h/2 # total energy of the prot struct (/2 because each bond is counted twice)
-        return tot_en
+        return self.energy_and_compactness(e)[0]
     
     
     def compactness(self) -> int:
@@ -153,14 +266,42 @@ class Protein():
         int :
             The total number of neighbours counted (doubled)
         '''
-        count_neig = 0 
-        
-        for i,seq in enumerate(self.seq):
-            count_neig += len(self.get_neig_of(i)) 
-        
-        return count_neig
-                
-    
+        return self.energy_and_compactness()[1]
+
+
+    def energy_and_compactness(self, e = 1., struct = None) -> tuple:
+        '''
+        Compute energy and compactness of the protein structure with a single scan of the neighbors.
+
+        Parameters
+        ----------
+        e : float, optional
+            e represent the binding energy.\n
+            The default is 1.
+        struct : np.ndarray, optional
+            Structure (with the same sequence) to use instead of the current one, e.g. min_en_struct.
+            The default is None (current structure).
+
+        Returns
+        -------
+        tuple
+            The energy and the compactness (see energy and compactness functions).
+        '''
+        if struct is None:
+            struct, grid, off = self.struct, self.grid, self.off
+        else: # occupancy grid built on the fly for a structure that is not the current one
+            struct = np.asarray(struct, dtype=np.int32).reshape(-1,2)
+            n = len(struct)
+            off = (n+1) - struct[0]
+            grid = np.full((2*n+4, 2*n+4), -1, dtype=np.int32)
+            grid[struct[:,0]+off[0], struct[:,1]+off[1]] = np.arange(n, dtype=np.int32)
+
+        count_h, count_neig = utils.contacts(struct, grid, off, self.is_h) # H-H and total neighbor pairs (exluding protein's backbone bonds)
+
+        tot_en = -e*count_h/2 # total energy of the prot struct (/2 because each bond is counted twice)
+        return tot_en, count_neig
+
+
     def get_neig_of(self, i : int) -> str:
         '''
         Function to see which are the neighbors of the i-th monomer of the protein sequence.
@@ -178,25 +319,17 @@ class Protein():
             Neighbors type H/P.
         '''
         neig = '' # string to save the neighbors
-        x,y = self.struct[i] # coordinates of the monomer
+        x,y = self.struct[i] + self.off # position of the monomer in the occupancy grid
+        near = self.grid[x+utils.NEIGHBORS[:,0], y+utils.NEIGHBORS[:,1]] # positions on the sequence of the monomers in the four neighbor points (-1 if empty)
 
-        possible_neig = [[x-1,y],[x,y-1],[x+1,y],[x,y+1]]
-
-        if i > 0: # if we are not in the starting monomer we remove the prevous monomer from the list
-            possible_neig.remove(self.struct[i-1])
-
-        if i < (self.n - 1): # if we are not in the ending monomer we remove the following monomer from the list
-            possible_neig.remove(self.struct[i+1])
-
-        for monomer in possible_neig: # check if the remaning points in the list contains some monomers (some neighbours)
-            if monomer in self.struct:
-                ind = self.struct.index(monomer) # get the position on the sequence of the neighbor
-                neig += self.seq[ind] # get the H/P monomer
+        for j in near.tolist():
+            if j >= 0 and j != i-1 and j != i+1: # the bounded monomers are not considered neighbors
+                neig += self.seq[j] # get the H/P monomer
 
         return neig
         
     
-    def random_fold(self) -> list:
+    def random_fold(self) -> np.ndarray:
         '''
         Randomly choose a monomer in the protein (exluding the first and the last) and fold the protein with a
         random method using the tail_fold function. If the structure generated is not valid
@@ -204,41 +337,10 @@ class Protein():
 
         Returns
         -------
-        list
+        np.ndarray
             The new rotein streucture randomly folded (valid).
         '''
-        c = 0 # counter of the number of folding until a valid sequence is founded
-        
-        while True: # cycle valid until a valid structure is found
-            index = random.randint(1, self.n-2) # select a random monomer where start the folding
-            x, y = self.struct[index] 
-            tail = self.struct[index:] # tail of the structure that will be folded
-
-            # Excluding diagonal move is the sequence cannot support it (the previous and following monomer are aligned)
-            distance_sur = utils.get_dist(self.struct[index-1],self.struct[index+1])
-            diag_move = True if math.isclose(distance_sur,math.sqrt(2)) else False
-            
-            for i,mon in enumerate(tail): # shifting the tail start in [0,0] for the folding
-                tail[i] = [mon[0]-x, mon[1]-y]
-            previous = self.struct[index-1] # recording the prev monomer
-            previous = [previous[0]-x, previous[1]-y]
-                
-            # choose a random method for the protein folding
-            method = random.randint(1, 8) if diag_move else random.randint(1, 7) # exclude diagonal move if the conditions don't match
-            tail = utils.tail_fold(struct=tail, method=method, previous=previous) # fold the tail with a random method
-            
-            for i,mon in enumerate(tail): # shifting the folded tail in the correct position
-                tail[i] = [mon[0]+x, mon[1]+y]
-            
-            new_struct = self.struct[:index] # construction of the new structure generated
-            for mon in tail: # pasting the new tail
-                new_struct.append(mon)
-                
-            c += 1
-                
-            if utils.is_valid_struct(new_struct): # if the structure is valid and the cycle 
-                break
-            
-        self.counter.append(c) # counter of the number of foldings
+        new_struct, c, _, _ = utils.random_fold(self.struct, self.grid, self.off, self.local_prob, self.crank_prob) # compiled folding, it counts also the number of foldings done
+        self.counter = np.append(self.counter, c) # counter of the number of foldings
 
         return new_struct
@@ -4,11 +4,14 @@
 """
 
 import protein_class as p
+import plots
 import utils
 import configparser
 from math import isclose, sqrt
 import random
+import copy
 import hypothesis
+import numpy as np
 
 configuration = configparser.ConfigParser()
 configuration.read('config_test.txt')
@@ -44,8 +47,19 @@ def test_is_valid_struct_when_correct(structure = correct_structure):
     '''
     
     assert utils.is_valid_struct(structure)
-    
-    
+
+
+def test_is_valid_struct_when_correct_array(structure = correct_structure):
+    '''
+    Test the is_valid_struct when a correct structure is given as a numpy array (as stored in the Protein class).
+
+    GIVEN: a correct structure as an int32 numpy array\n
+    WHEN: I want to verify if the structure is actually see as true with is_valid_struct\n
+    THEN: I expect a True response from the function
+    '''
+    assert utils.is_valid_struct(np.array(structure, dtype=np.int32))
+
+
 def test_is_valid_struct_when_wrong_double_point(structure = wrong_str_double_point):
     '''
     Test the is_valid_struct when a wrong structure is given, a list of wrong structures are given in 
@@ -246,6 +260,71 @@ def test_get_dist_2_sqrt_2():
     assert isclose(utils.get_dist((-1,1), (1,3)), 2*sqrt(2))  
 
 
+def test_get_dist_sq_1():
+    ''' 
+    Test get_dist_sq that computes correctly the squared euclidean distance
+    
+    GIVEN: two consecutive points in the lattice\n
+    WHEN: I want to compute the squared distance\n
+    THEN: I expect exactly 1
+    '''
+    assert utils.get_dist_sq((1,1), (1,2)) == 1
+
+
+def test_get_dist_sq_diagonal():
+    ''' 
+    Test get_dist_sq that computes correctly the squared euclidean distance
+    
+    GIVEN: two points on a diagonal of the lattice\n
+    WHEN: I want to compute the squared distance\n
+    THEN: I expect exactly 2
+    '''
+    assert utils.get_dist_sq((-1,1), (0,0)) == 2
+
+
+def test_protein_invalid_config_struct():
+    '''
+    Test that a Protein cannot be created from a configuration with an invalid structure.
+
+    GIVEN: a configuration whose structure jumps far away from the previous monomer
+    WHEN: I want to create the protein
+    THEN: I expect an AssertionError (and not an error from the occupancy grid)
+    '''
+    cfg = copy.copy(config)
+    cfg.seq = 'HPHPH'
+    cfg.use_struct = True
+    cfg.struct = [[0,0],[1,0],[2,0],[3,0],[40,0]]
+    raised = False
+    try:
+        p.Protein(cfg)
+    except AssertionError:
+        raised = True
+    assert raised
+
+
+def test_struct_setter_invalid_struct_unchanged():
+    '''
+    Test that assigning an invalid structure to the protein raises an error and leaves the protein unchanged.
+
+    GIVEN: a protein and an invalid structure with negative coordinates out of the occupancy grid
+    WHEN: I assign the invalid structure to the protein
+    THEN: I expect an AssertionError and the same structure and occupancy grid as before
+    '''
+    prot = p.Protein(config)
+    struct = prot.struct.copy()
+    grid = prot.grid.copy()
+    wrong = struct.copy()
+    wrong[-1] = [-100, -100]
+    raised = False
+    try:
+        prot.struct = wrong
+    except AssertionError:
+        raised = True
+    assert raised
+    assert np.array_equal(prot.struct, struct)
+    assert np.array_equal(prot.grid, grid)
+
+
 def test_energy_computation():
     '''
     Test the energy computation of the protein structures for two structures defined above.
@@ -301,7 +380,7 @@ def test_random_fold_valid_struc_linear():
     WHEN: I want to randomly fold the protein
     THEN: I expect a valid protein structure
     '''
-    random.seed(4326748)
+    utils.set_seed(4326748)
     n = 1000
     prot = p.Protein(config)
     prot.seq = 'HPHPHPHPHPHHHHHPPHPHPHPPHHPPPPHHPP'
@@ -319,7 +398,7 @@ def test_random_fold_valid_struc_composite():
     WHEN: I want to randomly fold the protein
     THEN: I expect a valid protein structure
     '''
-    random.seed(7694)
+    utils.set_seed(7694)
     n = 1000
     prot = p.Protein(config)
     prot.seq = seq
@@ -329,6 +408,63 @@ def test_random_fold_valid_struc_composite():
         prot.struct = prot.random_fold()
         assert utils.is_valid_struct(prot.struct)
 
+
+def test_random_fold_only_pivot_moves():
+    '''
+    Test that with local_prob = 0 the random fold only uses pivot moves.
+
+    GIVEN: a valid composite protein structure and a zero probability of local moves
+    WHEN: I want to randomly fold the protein
+    THEN: I expect that the folding always moves the whole tail (up to the last monomer)
+    '''
+    utils.set_seed(7694)
+    prot = p.Protein(config)
+    prot.seq = seq
+    prot.struct = correct_structure
+    for i in range(200):
+        new_struct, c, start, stop = utils.random_fold(prot.struct, prot.grid, prot.off, local_prob = 0.)
+        assert stop == len(seq)
+        assert c >= 1
+
+
+def test_configuration_invalid_local_prob():
+    '''
+    Test that a configuration with only local moves (local_move_prob = 1) is rejected.
+
+    GIVEN: a configuration file with local_move_prob = 1
+    WHEN: I read the configuration
+    THEN: I expect a ValueError (a linear structure could never be folded with only local moves)
+    '''
+    configuration1 = configparser.ConfigParser()
+    configuration1.read('config_test.txt')
+    configuration1['optional']['local_move_prob'] = '1'
+    raised = False
+    try:
+        utils.Configuration(configuration1)
+    except ValueError:
+        raised = True
+    assert raised
+
+
+def test_configuration_invalid_pt_temperatures():
+    '''
+    Test that a parallel tempering configuration with a single replica is rejected.
+
+    GIVEN: a configuration file with parallel_tempering = TRUE and only one temperature
+    WHEN: I read the configuration
+    THEN: I expect a ValueError (no exchange is possible with a single replica)
+    '''
+    configuration1 = configparser.ConfigParser()
+    configuration1.read('config_test.txt')
+    configuration1['optional']['parallel_tempering'] = 'TRUE'
+    configuration1['optional']['pt_temperatures'] = '[1.0]'
+    raised = False
+    try:
+        utils.Configuration(configuration1)
+    except ValueError:
+        raised = True
+    assert raised
+
     
 def test_tail_fold_valid_struct_1():
     '''
@@ -587,6 +723,23 @@ def test_diagonal_move_first_mon_move():
     assert isclose(d, 1)
     
     
+def test_tail_fold_crankshaft():
+    '''
+    Test that the crankshaft move flips the U formed by the first two monomers of the tail.
+
+    GIVEN: a structure with a U formed by the second and third monomer
+    WHEN: I want to fold the protein with the crankshaft move
+    THEN: I expect the two monomers flipped on the other side and a valid structure
+    '''
+    struct = [[0,0],[0,1],[1,1],[1,0],[2,0]]
+    tail = [[0,0],[1,0],[1,-1],[2,-1]] # struct[1:] shifted to start in [0,0]
+    previous = [0,-1]
+
+    new_tail = utils.tail_fold(tail, 9, previous)
+    assert new_tail.tolist() == [[0,-2],[1,-2],[1,-1],[2,-1]]
+    assert utils.is_valid_struct([struct[0]] + (new_tail + [0,1]).tolist())
+
+
 def test_hp_sequence_transform_letters_correct():
     '''
     Test that hp_sequence_transform return a str with only H and P.
@@ -612,6 +765,17 @@ def test_hp_sequence_transform_letters_wrong():
         pass
 
 
+def test_hp_sequence_transform_mapping():
+    '''
+    Test that hp_sequence_transform maps the polar amino acids into P and the hydrophobic ones into H.
+
+    GIVEN: the sequence of all the 20 amino acids, polar first
+    WHEN: I want to convert it into a sequence with only H and P
+    THEN: I expect 9 P followed by 11 H
+    '''
+    assert utils.hp_sequence_transform('RNDQEHKSTACGILMFPWYV') == 'P'*9 + 'H'*11
+
+
 def test_hp_sequence_transform_lenght_correct():
     '''
     Test that hp_sequence_transform conserve the length of the sequence.
@@ -668,3 +832,113 @@ def test_evolution_maximize_compactness():
     prot1.evolution()
     # asserts for the energy minimization after the evolution (energy shoul not be grater than zero)
     assert prot1.compactness() >= comp1
+
+
+def test_evolution_incremental_energy_compactness():
+    '''
+    Test that the energy and compactness updated incrementally during the evolution match the ones
+    recomputed on the final structure.
+
+    GIVEN: a protein with a linear structure
+    WHEN: I evolve the system for a certain number of steps
+    THEN: I expect the last recorded energy and compactness to be the ones of the final structure
+    '''
+    utils.set_seed(2187)
+    prot1 = p.Protein(config)
+    prot1.seq = seq1
+    prot1.struct = utils.linear_struct(prot1.seq)
+    prot1.n = len(seq1)
+    prot1.steps = 1000
+    prot1.evolution()
+    assert isclose(prot1.en_evo[-1], prot1.energy())
+    assert prot1.comp_evo[-1] == prot1.compactness()
+
+
+def test_parallel_tempering_valid_struct():
+    '''
+    Test that the parallel tempering gives a valid structure and does not increase the min energy found.
+
+    GIVEN: a protein with a linear structure
+    WHEN: I evolve the system with the parallel tempering
+    THEN: I expect a valid structure and a min energy not grater than zero
+    '''
+    prot1 = p.Protein(config)
+    prot1.seq = seq1
+    prot1.struct = utils.linear_struct(prot1.seq)
+    prot1.n = len(seq1)
+    prot1.parallel_tempering([0.2, 0.4, 0.7, 1.], sweeps = 20, swap_interval = 50)
+    assert utils.is_valid_struct(prot1.struct)
+    assert utils.is_valid_struct(prot1.min_en_struct)
+    assert prot1.min_en <= 0.
+    assert prot1.min_en <= prot1.energy()
+
+
+def test_view_min_en_labels_after_parallel_tempering():
+    '''
+    Test that the min energy view is labelled with the energy and compactness of the structure drawn, also when it
+    has been found by the parallel tempering (which records only the coldest replica in the evolution history).
+
+    GIVEN: a protein evolved only with the parallel tempering
+    WHEN: I plot the min energy structure
+    THEN: I expect the min energy found and the normalized compactness of that structure in the labels
+    '''
+    prot1 = p.Protein(config)
+    prot1.parallel_tempering([0.2, 0.4, 0.7, 1.], sweeps = 20, swap_interval = 50)
+    en, comp = prot1.energy_and_compactness(struct = prot1.min_en_struct)
+    plots.view_min_en(prot1, save = False)
+    labels = [t.get_text() for t in plots.plt.gca().texts]
+    plots.plt.close('all')
+    assert en == prot1.min_en
+    assert f'Energy: {prot1.min_en}' in labels
+    assert f'Compactness: {comp/(prot1.max_comp+10e-15):.2f}' in labels
+
+
+def test_parallel_tempering_history():
+    '''
+    Test that the parallel tempering records one entry of the coldest replica for each sweep in the evolution history.
+
+    GIVEN: a protein evolved with the parallel tempering
+    WHEN: I look at the evolution history and at the returned exchange rate
+    THEN: I expect sweeps new entries aligned with the temperatures, the last one equal to the final structure and a rate in [0,1]
+    '''
+    prot1 = p.Protein(config)
+    rate = prot1.parallel_tempering([0.2, 0.4, 0.7, 1.], sweeps = 20, swap_interval = 50)
+    assert len(prot1.en_evo) == len(prot1.comp_evo) == len(prot1.T) == 21
+    assert np.all(prot1.T[1:] == 0.2)
+    assert (prot1.en_evo[-1], prot1.comp_evo[-1]) == prot1.energy_and_compactness()
+    assert 0 <= rate <= 1
+
+
+def test_evolution_gif_few_steps():
+    '''
+    Test that the structures for the gif are saved also when the number of steps is lower than 100.
+
+    GIVEN: a protein with the gif creation enabled and less than 100 steps
+    WHEN: I evolve the system
+    THEN: I expect a structure saved for each step
+    '''
+    prot1 = p.Protein(config)
+    prot1.steps = 50
+    prot1.gif = True
+    prot1.evolution()
+    assert len(prot1.gif_struct) == 50
+
+
+def test_evolution_valid_struct():
+    '''
+    Test that the evolution of the protein gives valid structures.
+
+    GIVEN: a protein with a linear structure
+    WHEN: I evolve the system for a certain number of steps
+    THEN: I expect the final, the min energy and the max compactness structures to be valid
+    '''
+    utils.set_seed(5511)
+    prot1 = p.Protein(config)
+    prot1.seq = seq1
+    prot1.struct = utils.linear_struct(prot1.seq)
+    prot1.n = len(seq1)
+    prot1.steps = 2000
+    prot1.evolution()
+    assert utils.is_valid_struct(prot1.struct)
+    assert utils.is_valid_struct(prot1.min_en_struct)
+    assert utils.is_valid_struct(prot1.max_comp_struct)
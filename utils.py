@@ -2,38 +2,62 @@
 """
 @author: Tommaso Giacometti
 """
-from math import sqrt, isclose
+from math import hypot, exp
+from numba import njit, prange
+import numpy as np
 import random
 import json
 
-
-def is_valid_struct(struct : list) -> bool:
+NEIGHBORS = np.array([[-1,0],[0,-1],[1,0],[0,1]], dtype=np.int32) # offsets of the four neighbor positions in the lattice
+SYMMETRIES = np.array([[[0,1],[-1,0]], # 1: 90° clockwise rotation
+                       [[0,-1],[1,0]], # 2: 90° anticlockwise rotation
+                       [[-1,0],[0,-1]], # 3: 180° rotation
+                       [[1,0],[0,-1]], # 4: x-axis reflection
+                       [[-1,0],[0,1]], # 5: y-axis reflection
+                       [[0,-1],[-1,0]], # 6: 1 and 3 quadrant bisector symmetry
+                       [[0,1],[1,0]]], # 7: 2 and 4 quadrant bisector symmetry
+                      dtype=np.int32) # matrices of the lattice symmetries used by the tail folding (methods 1-7)
+HP_TABLE = np.zeros(256, dtype=np.uint8) # lookup table from the amino acids letters (bytes) to H/P (0 if not an amino acid)
+HP_TABLE[np.frombuffer(b'RNDQEHKST', dtype=np.uint8)] = ord('P') # polar amino acids
+HP_TABLE[np.frombuffer(b'ACGILMFPWYV', dtype=np.uint8)] = ord('H') # hydrophobic amino acids
+
+
+def is_valid_struct(struct) -> bool:
     '''
     Check if the structure inserted is valid: is SAW (self avoid walk) and distances between consecutive elements are 1.
 
     Parameters
     ----------
-    struct : list
-        Structur of the protein containing x and y coordinate in a list.
+    struct : list or np.ndarray
+        Structur of the protein containing x and y coordinate of each monomer.
 
     Returns
     -------
     bool
         True if the structure is valid, False if is not.
     '''
-    unique_struct = [] # counter of the monomer positions
-    n = len(struct) # length of the sequence
-    
+    struct = np.asarray(struct, dtype=np.int32).reshape(-1,2) # the compiled check works on a (n,2) int32 array
+    return _is_valid_struct(struct)
+
+
+@njit(cache=True)
+def _is_valid_struct(struct : np.ndarray) -> bool:
+    '''
+    Compiled core of is_valid_struct, it takes the structure as a (n,2) int32 numpy array.
+    '''
+    n = struct.shape[0] # length of the sequence
+    occupied = set() # points of the lattice already occupied, each one packed in a single int64 key
+
     for i in range(n):
-        if struct[i] in unique_struct:
-            return False
-        else:
-            unique_struct.append(struct[i])
-        
-        if (i<n-1): # check distance between the monomer i and the following one
-            if not isclose(get_dist(struct[i], struct[i+1]),1):
+        if i < n-1:
+            if get_dist_sq(struct[i+1], struct[i]) != 1: # on the lattice the distance is 1 only if the squared distance is exactly 1
                 return False
-            
+
+        key = np.int64(struct[i,0])*4294967296 + struct[i,1] # unique for each couple of int32 coordinates
+        if key in occupied: # the monomer overlaps with a previous one
+            return False
+        occupied.add(key)
+
     return True
 
 
@@ -55,17 +79,8 @@ def is_valid_sequence(seq : str) -> bool:
         print('The sequence is too short. It must be at least 3.')
         return False
     
-    unique_c = set(seq) # set of all the letters present in the sequence
-    
-    if len(unique_c) == 2:
-        if 'H' in unique_c and 'P' in unique_c:
-            return True
-    elif len(unique_c) == 1:
-        if 'H' in unique_c or 'P' in unique_c:
-            return True   
-        
-    return False # if True is not returned yet, return Fasle since the sequence must be invalid 
-    
+    return set(seq) <= {'H','P'} # valid only if all the letters in the sequence are H or P
+
 
 def linear_struct(seq : str) -> list:
     '''
@@ -107,10 +122,33 @@ def get_dist(coord1 : list, coord2 : list) -> float:
     float
         Euclidean distance as a float.
     '''
-    dist = sqrt((coord1[0]-coord2[0])**2 + (coord1[1]-coord2[1])**2)
+    dist = hypot(coord1[0]-coord2[0], coord1[1]-coord2[1])
     return dist
 
 
+@njit(cache=True)
+def get_dist_sq(coord1, coord2) -> int:
+    '''
+    Compute the squared distance of two points in the lattice.
+    Since the coordinates are integers it is exact, so it can be compared directly with 1 or 2 without using sqrt.
+
+    Parameters
+    ----------
+    coord1 : list
+        x and y coordinate in the lattice of the first monomer.
+    coord2 : list
+        x and y coordinate in the lattice of the second monomer.
+
+    Returns
+    -------
+    int
+        Squared euclidean distance.
+    '''
+    dx = coord1[0] - coord2[0]
+    dy = coord1[1] - coord2[1]
+    return dx*dx + dy*dy
+
+
 def diagonal_move(struct : list, previous : list) -> list:
     '''
     Move the first monomer along a diagonal looking at the previous and following monomers in the sequence. \n
@@ -129,7 +167,6 @@ def diagonal_move(struct : list, previous : list) -> list:
     list
         The structure with the first monomer moved.
     '''
-    case = random.randint(0, 1) # random movement respect the second monomer
     x_prev, y_prev = previous # previous monomer coords
     x_foll, y_foll = struct[1] # following monomer coordinates
 
@@ -138,7 +175,7 @@ def diagonal_move(struct : list, previous : list) -> list:
     return struct
 
 
-def tail_fold(struct : list, method : int, previous : list) -> list:
+def tail_fold(struct, method : int, previous) -> np.ndarray:
     '''
     Apply a rotation/inversion of symmetry at the sequence inserted.\n
     7 methods are present:
@@ -150,50 +187,527 @@ def tail_fold(struct : list, method : int, previous : list) -> list:
         6: 1 and 3 quadrant bisector symmetry
         7: 2 and 4 quadrant bisector symmetry
         8: movement on a digaonal of a random monomer
+        9: crankshaft move of the first two monomers (they must form a U with the previous and the third monomer)
 
     Parameters
     ----------
-    struct : list
+    struct : list or np.ndarray
         Structure of the sequence for which each element is the x and y coordinates of the monomer.
     method : int
         The method to apply to the structure.
-    previous : list
+    previous : list or np.ndarray
         x and y coordinates of the previous monomer shifted such that the first monomer of struct is [0,0]
 
     Returns
     -------
-    list
+    np.ndarray
         The structure transformed.
     ''' 
-    new_tail = []
-    
-    if method == 1: # 90 rotation clockwise 
-        for x,y in struct:
-            new_tail.append([y,-x])
-    if method == 2: # 90 rotation anticlockwise
-        for x,y in struct:
-            new_tail.append([-y,x])
-    if method == 3: # 180 rotation
-        for x,y in struct:
-            new_tail.append([-x,-y])
-    if method == 4: # x-axis refletion
-        for x,y in struct:
-            new_tail.append([x,-y])
-    if method == 5: # y-axis reflection
-        for x,y in struct:
-            new_tail.append([-x,y])
-    if method == 6: # 1 and 3 quadrant bisector symmetry
-        for x,y in struct:
-            new_tail.append([-y,-x])
-    if method == 7: # 2 and 4 quadrant bisector symmetry
-        for x,y in struct:
-            new_tail.append([y,x])
-    if method == 8: # movement on the digonal
-        new_tail = diagonal_move(struct, previous)
-                
+    struct = np.asarray(struct, dtype=np.int32).reshape(-1,2)
+    previous = np.asarray(previous, dtype=np.int32)
+    new_tail = np.empty_like(struct)
+    _tail_fold(struct, method, previous, new_tail)
     return new_tail
 
 
+@njit(cache=True)
+def _tail_fold(struct : np.ndarray, method : int, previous : np.ndarray, out : np.ndarray) -> None:
+    '''
+    Compiled core of tail_fold, it takes the structure as a (n,2) int32 numpy array and writes the structure folded
+    around its first monomer in out (with the same shape), without allocating new arrays.
+    The first monomer of struct does not need to be in [0,0], previous must be in the same coordinates of struct.
+    '''
+    x0 = struct[0,0] # origin of the folding
+    y0 = struct[0,1]
+
+    if method == 8: # movement on the digonal (same as diagonal_move)
+        out[:] = struct
+        out[0,0] = previous[0] + struct[1,0] - x0
+        out[0,1] = previous[1] + struct[1,1] - y0
+        return
+    if method == 9: # crankshaft: the U formed by the first two monomers is flipped around the previous-third monomers axis
+        out[:] = struct
+        out[0,0] = 2*previous[0] - x0
+        out[0,1] = 2*previous[1] - y0
+        out[1,0] = 2*struct[2,0] - struct[1,0]
+        out[1,1] = 2*struct[2,1] - struct[1,1]
+        return
+    if method < 1 or method > 9:
+        raise ValueError('The folding method must be an integer between 1 and 9')
+
+    a = SYMMETRIES[method-1,0,0] # matrix of the symmetry
+    b = SYMMETRIES[method-1,0,1]
+    c = SYMMETRIES[method-1,1,0]
+    d = SYMMETRIES[method-1,1,1]
+    for i in range(struct.shape[0]):
+        x = struct[i,0] - x0
+        y = struct[i,1] - y0
+        out[i,0] = a*x + b*y + x0
+        out[i,1] = c*x + d*y + y0
+
+
+@njit(cache=True)
+def random_fold(struct : np.ndarray, grid : np.ndarray, off : np.ndarray, local_prob : float = 0.5,
+                crank_prob : float = 0.5) -> tuple:
+    '''
+    Compiled version of the random folding of the protein, the structure is a (n,2) int32 numpy array.
+    A random monomer (exluding the first and the last) and a random method are chosen and the tail is folded with
+    _tail_fold, if the structure generated is not valid the process is repited until a valid structure is found.
+    With probability local_prob a local move (diagonal or crankshaft) is tried, otherwise a pivot move (1-7).
+    If the chosen monomer allows no local move the draw is repeated (and not counted as a folding), if it allows
+    both the crankshaft is chosen with probability crank_prob.
+
+    Parameters
+    ----------
+    struct : np.ndarray
+        Structure of the protein.
+    grid : np.ndarray
+        Occupancy grid of the lattice for the structure (it is not modified).
+    off : np.ndarray
+        Offset from the lattice coordinates to the grid indices.
+    local_prob : float, optional
+        Probability to try a local move instead of a pivot move. The default is 0.5.
+    crank_prob : float, optional
+        Probability to choose the crankshaft move when also the diagonal move is possible. The default is 0.5.
+
+    Returns
+    -------
+    tuple
+        The new structure (valid), the number of foldings needed to find it and the range [start, stop) of the
+        monomers moved by the folding.
+    '''
+    new_struct = np.empty_like(struct)
+    c, start, stop = _random_fold(struct, new_struct, grid, off, local_prob, crank_prob)
+    return new_struct, c, start, stop
+
+
+@njit(cache=True)
+def _random_fold(struct : np.ndarray, new_struct : np.ndarray, grid : np.ndarray, off : np.ndarray,
+                 local_prob : float = 0.5, crank_prob : float = 0.5) -> tuple:
+    '''
+    Compiled core of random_fold, the new structure is written in the preallocated new_struct (same shape of struct).
+    It returns the number of foldings and the range [start, stop) of the monomers moved.
+    The moves keep the bonds of unit length by construction, so a new structure is valid if no moved monomer lands
+    on a cell of the occupancy grid occupied by a monomer which is not moved: only the moved monomers are checked.
+    '''
+    n = struct.shape[0]
+    c = 0 # counter of the number of folding until a valid sequence is founded
+    new_struct[:] = struct
+
+    while True: # cycle valid until a valid structure is found
+        index = np.random.randint(1, n-1) # select a random monomer where start the folding
+
+        if np.random.random() < local_prob: # local move, only one or two monomers are moved
+            # diagonal move only if the previous and following monomer are on a diagonal
+            corner = get_dist_sq(struct[index+1], struct[index-1]) == 2
+            # crankshaft move only if the monomers index and index+1 form a U with the previous and the following ones
+            crank = (index < n-2 and abs(struct[index+2,0] - struct[index-1,0]) + abs(struct[index+2,1] - struct[index-1,1]) == 1
+                     and struct[index,0] - struct[index-1,0] == struct[index+1,0] - struct[index+2,0]
+                     and struct[index,1] - struct[index-1,1] == struct[index+1,1] - struct[index+2,1])
+            if corner and crank:
+                method = 9 if np.random.random() < crank_prob else 8
+            elif corner:
+                method = 8
+            elif crank:
+                method = 9
+            else: # no local move is possible for this monomer
+                continue
+        else: # pivot move, the whole tail is rotated/reflected
+            method = np.random.randint(1, 8)
+        c += 1 # only the draws where a move can be applied are counted as foldings
+
+        if method <= 7: # the pivot is checked while the tail is folded, the whole tail is moved
+            if _pivot_fold(struct, new_struct, index, method, grid, off):
+                return c, index, n
+            continue
+
+        stop = index + 1 if method == 8 else index + 2 # the diagonal move changes only one monomer, the crankshaft two
+        _tail_fold(struct[index:stop+1], method, struct[index-1], new_struct[index:stop+1]) # the local moves need also the following monomer
+
+        valid = True
+        for i in range(index, stop):
+            j = grid[new_struct[i,0]+off[0], new_struct[i,1]+off[1]]
+            if j >= 0 and (j < index or j >= stop): # the cell is occupied by a monomer that is not moved
+                valid = False
+                break
+        if valid:
+            return c, index, stop
+
+        new_struct[index:stop] = struct[index:stop] # restore the buffer for the next attempt
+
+
+@njit(cache=True)
+def _pivot_fold(struct : np.ndarray, new_struct : np.ndarray, index : int, method : int, grid : np.ndarray, off : np.ndarray) -> bool:
+    '''
+    Fold the tail of the structure around the monomer index with the symmetry method (1-7), writing it in new_struct.
+    The monomers are moved one at a time and the folding stops at the first one landing on a cell of the occupancy
+    grid occupied by the fixed part of the structure, so the rest of the tail is not computed.
+    It returns True if the new structure is valid, otherwise new_struct is restored equal to struct.
+    '''
+    x0 = struct[index,0] # origin of the folding
+    y0 = struct[index,1]
+    a = SYMMETRIES[method-1,0,0] # matrix of the symmetry
+    b = SYMMETRIES[method-1,0,1]
+    c = SYMMETRIES[method-1,1,0]
+    d = SYMMETRIES[method-1,1,1]
+
+    for i in range(index+1, struct.shape[0]):
+        x = struct[i,0] - x0
+        y = struct[i,1] - y0
+        new_x = a*x + b*y + x0
+        new_y = c*x + d*y + y0
+        j = grid[new_x+off[0], new_y+off[1]]
+        if 0 <= j < index: # the cell is occupied by a monomer that is not moved
+            new_struct[index+1:i] = struct[index+1:i]
+            return False
+        new_struct[i,0] = new_x
+        new_struct[i,1] = new_y
+
+    return True
+
+
+@njit(cache=True)
+def contacts(struct : np.ndarray, grid : np.ndarray, off : np.ndarray, is_h : np.ndarray) -> tuple:
+    '''
+    Count, in a single pass, the H-H neighbor pairs and all the neighbor pairs of the structure (exluding protein's
+    backbone bonds) using the occupancy grid. Each pair is counted twice.
+
+    Parameters
+    ----------
+    struct : np.ndarray
+        Structure of the protein.
+    grid : np.ndarray
+        Occupancy grid of the lattice, each cell contains the position on the sequence of the monomer in it (-1 if empty).
+    off : np.ndarray
+        Offset from the lattice coordinates to the grid indices.
+    is_h : np.ndarray
+        Boolean mask of the H monomers in the sequence.
+
+    Returns
+    -------
+    tuple
+        Number of H-H neighbors (doubled) and number of neighbors (doubled).
+    '''
+    count_h = 0
+    count_neig = 0
+
+    for i in range(struct.shape[0]):
+        x = struct[i,0] + off[0]
+        y = struct[i,1] + off[1]
+        for k in range(4):
+            j = grid[x+NEIGHBORS[k,0], y+NEIGHBORS[k,1]]
+            if j >= 0 and j != i-1 and j != i+1: # the bounded monomers are not considered neighbors
+                count_neig += 1
+                if is_h[i] and is_h[j]:
+                    count_h += 1
+
+    return count_h, count_neig
+
+
+@njit(cache=True)
+def moved_contacts(struct : np.ndarray, grid : np.ndarray, off : np.ndarray, is_h : np.ndarray, start : int, stop : int) -> tuple:
+    '''
+    Count the neighbor pairs between the monomers in [start, stop) and the ones outside this range (exluding
+    protein's backbone bonds) using the occupancy grid. Each pair is counted once.
+    Since the foldings move the monomers in the range rigidly (or just one monomer), the pairs inside the range do
+    not change and the variation of energy and compactness depends only on these pairs.
+
+    Parameters
+    ----------
+    struct : np.ndarray
+        Structure of the protein.
+    grid : np.ndarray
+        Occupancy grid of the lattice for the structure.
+    off : np.ndarray
+        Offset from the lattice coordinates to the grid indices.
+    is_h : np.ndarray
+        Boolean mask of the H monomers in the sequence.
+    start : int
+        First monomer of the range.
+    stop : int
+        Monomer after the last one of the range.
+
+    Returns
+    -------
+    tuple
+        Number of H-H neighbors and number of neighbors.
+    '''
+    count_h = 0
+    count_neig = 0
+
+    for i in range(start, stop):
+        x = struct[i,0] + off[0]
+        y = struct[i,1] + off[1]
+        for k in range(4):
+            j = grid[x+NEIGHBORS[k,0], y+NEIGHBORS[k,1]]
+            if j >= 0 and (j < start or j >= stop) and j != i-1 and j != i+1: # the bounded monomers are not considered neighbors
+                count_neig += 1
+                if is_h[i] and is_h[j]:
+                    count_h += 1
+
+    return count_h, count_neig
+
+
+@njit(cache=True)
+def update_grid(grid : np.ndarray, off : np.ndarray, old_struct : np.ndarray, new_struct : np.ndarray, start : int, stop : int) -> None:
+    '''
+    Update in place the occupancy grid moving the monomers in [start, stop) from the old structure to the new one.
+    '''
+    for i in range(start, stop):
+        grid[old_struct[i,0]+off[0], old_struct[i,1]+off[1]] = -1
+    for i in range(start, stop):
+        grid[new_struct[i,0]+off[0], new_struct[i,1]+off[1]] = i
+
+
+@njit(cache=True)
+def mc_step(struct : np.ndarray, new_struct : np.ndarray, grid : np.ndarray, off : np.ndarray, is_h : np.ndarray,
+            T : float, en : float, comp : int, local_prob : float = 0.5, crank_prob : float = 0.5) -> tuple:
+    '''
+    Compiled step of the Metropolis algorithm: the structure is randomly folded and the new structure is accepted
+    if its energy is lower, otherwise it is accepted with probability exp(-dE/T).
+    Energy and compactness are updated incrementally, counting only the contacts of the moved monomers.
+    The candidate structure is written in the preallocated new_struct, so no array is allocated: if the step is
+    accepted the caller has to swap the two arrays. The occupancy grid is updated in place to match the structure
+    after the step.
+
+    Parameters
+    ----------
+    struct : np.ndarray
+        Current structure of the protein.
+    new_struct : np.ndarray
+        Buffer (same shape of struct) where the new structure is written.
+    grid : np.ndarray
+        Occupancy grid of the lattice for the current structure.
+    off : np.ndarray
+        Offset from the lattice coordinates to the grid indices.
+    is_h : np.ndarray
+        Boolean mask of the H monomers in the sequence.
+    T : float
+        Temperature of the system.
+    en : float
+        Energy of the current structure.
+    comp : int
+        Compactness of the current structure.
+    local_prob : float, optional
+        Probability to try a local move instead of a pivot move (see random_fold). The default is 0.5.
+    crank_prob : float, optional
+        Probability to choose the crankshaft move when also the diagonal move is possible. The default is 0.5.
+
+    Returns
+    -------
+    tuple
+        True if the new structure is accepted, the energy and the compactness after the step and the number of
+        foldings done.
+    '''
+    c, start, stop = _random_fold(struct, new_struct, grid, off, local_prob, crank_prob) # new structure is generated
+    old_h, old_neig = moved_contacts(struct, grid, off, is_h, start, stop)
+    update_grid(grid, off, struct, new_struct, start, stop)
+    new_h, new_neig = moved_contacts(new_struct, grid, off, is_h, start, stop)
+    d_en = float(old_h - new_h) # variation of the energy, each lost H-H contact increases it by 1
+
+    if d_en > 0: # if the new energy is higher to the previus one, the new structure is accepted following the Metropolis alg
+        r = np.random.random()
+        p = exp(-d_en/T) # probability to accept the new structure
+        if r > p: # the new structure is not accepted (the grid is moved back to the initial structure)
+            update_grid(grid, off, new_struct, struct, start, stop)
+            return False, en, comp, c
+
+    return True, en + d_en, comp + 2*(new_neig - old_neig), c # the compactness counts each pair twice
+
+
+@njit(cache=True)
+def mc_evolution(struct : np.ndarray, new_struct : np.ndarray, grid : np.ndarray, off : np.ndarray, is_h : np.ndarray,
+                 T : np.ndarray, en : float, comp : int, min_en : float, min_en_struct : np.ndarray, max_comp : int,
+                 max_comp_struct : np.ndarray, en_evo : np.ndarray, comp_evo : np.ndarray, counter : np.ndarray,
+                 local_prob : float = 0.5, crank_prob : float = 0.5) -> tuple:
+    '''
+    Compiled loop of Metropolis steps (one for each temperature in T), so that no python code (random numbers
+    included) runs between two steps. The arrays are updated in place: struct contains the structure at the end of
+    the loop (new_struct is used as buffer) while min_en_struct and max_comp_struct are overwritten only when a
+    structure with lower energy or higher compactness is found.
+
+    Parameters
+    ----------
+    struct : np.ndarray
+        Current structure of the protein.
+    new_struct : np.ndarray
+        Buffer (same shape of struct) for the new structures.
+    grid : np.ndarray
+        Occupancy grid of the lattice for the current structure.
+    off : np.ndarray
+        Offset from the lattice coordinates to the grid indices.
+    is_h : np.ndarray
+        Boolean mask of the H monomers in the sequence.
+    T : np.ndarray
+        Temperature of the system at each step.
+    en : float
+        Energy of the current structure.
+    comp : int
+        Compactness of the current structure.
+    min_en : float
+        Min energy found so far.
+    min_en_struct : np.ndarray
+        Array where the min energy structure is written.
+    max_comp : int
+        Max compactness found so far.
+    max_comp_struct : np.ndarray
+        Array where the max compactness structure is written.
+    en_evo : np.ndarray
+        Array (same length of T) where the energy after each step is written.
+    comp_evo : np.ndarray
+        Array (same length of T) where the compactness after each step is written.
+    counter : np.ndarray
+        Array (same length of T) where the number of foldings of each step is written.
+    local_prob : float, optional
+        Probability to try a local move instead of a pivot move (see random_fold). The default is 0.5.
+    crank_prob : float, optional
+        Probability to choose the crankshaft move when also the diagonal move is possible. The default is 0.5.
+
+    Returns
+    -------
+    tuple
+        Energy and compactness of the final structure, min energy and max compactness found.
+    '''
+    cur = struct
+    buf = new_struct
+    swaps = 0
+
+    for k in range(T.shape[0]):
+        accepted, en, comp, c = mc_step(cur, buf, grid, off, is_h, T[k], en, comp, local_prob, crank_prob)
+        if accepted: # the new structure is in the buffer, the two arrays are swapped without copies
+            cur, buf = buf, cur
+            swaps += 1
+        counter[k] = c
+        en_evo[k] = en
+        comp_evo[k] = comp
+        if en < min_en:
+            min_en = en
+            min_en_struct[:] = cur
+        if comp > max_comp:
+            max_comp = comp
+            max_comp_struct[:] = cur
+
+    if swaps % 2 == 1: # the final structure is in the buffer
+        struct[:] = cur
+
+    return en, comp, min_en, max_comp
+
+
+@njit(cache=True, parallel=True)
+def replicas_sweep(structs : np.ndarray, grids : np.ndarray, off : np.ndarray, is_h : np.ndarray, T : np.ndarray,
+                   en : np.ndarray, comp : np.ndarray, min_en : np.ndarray, min_en_structs : np.ndarray,
+                   max_comp : np.ndarray, max_comp_structs : np.ndarray, steps : int, local_prob : float = 0.5,
+                   crank_prob : float = 0.5) -> None:
+    '''
+    Evolve independently, and in parallel on the available cores, R replicas of the protein for a certain number of
+    Metropolis steps, each replica at its own temperature. All the arrays are updated in place.
+    Each thread has its own random generator, so the result is not reproducible even if the seed is set.
+
+    Parameters
+    ----------
+    structs : np.ndarray
+        Structures of the replicas, shape (R,n,2).
+    grids : np.ndarray
+        Occupancy grids of the replicas, shape (R,2n+4,2n+4).
+    off : np.ndarray
+        Offset from the lattice coordinates to the grid indices (the same for all the replicas).
+    is_h : np.ndarray
+        Boolean mask of the H monomers in the sequence.
+    T : np.ndarray
+        Temperatures of the replicas.
+    en : np.ndarray
+        Energies of the replicas.
+    comp : np.ndarray
+        Compactness of the replicas.
+    min_en : np.ndarray
+        Min energy found by each replica.
+    min_en_structs : np.ndarray
+        Min energy structure found by each replica.
+    max_comp : np.ndarray
+        Max compactness found by each replica.
+    max_comp_structs : np.ndarray
+        Max compactness structure found by each replica.
+    steps : int
+        Number of Metropolis steps for each replica.
+    local_prob : float, optional
+        Probability to try a local move instead of a pivot move (see random_fold). The default is 0.5.
+    crank_prob : float, optional
+        Probability to choose the crankshaft move when also the diagonal move is possible. The default is 0.5.
+    '''
+    for r in prange(structs.shape[0]):
+        struct = structs[r].copy()
+        new_struct = np.empty_like(struct) # buffer for the new structures, swapped with struct when accepted
+        for _ in range(steps):
+            accepted, en[r], comp[r], c = mc_step(struct, new_struct, grids[r], off, is_h, T[r], en[r], comp[r],
+                                                    local_prob, crank_prob)
+            if accepted:
+                struct, new_struct = new_struct, struct
+            if en[r] < min_en[r]:
+                min_en[r] = en[r]
+                min_en_structs[r] = struct
+            if comp[r] > max_comp[r]:
+                max_comp[r] = comp[r]
+                max_comp_structs[r] = struct
+        structs[r] = struct
+
+
+@njit(cache=True)
+def replicas_swap(T : np.ndarray, en : np.ndarray) -> int:
+    '''
+    Attempt the exchange of the temperatures between the replicas adjacent in temperature (parallel tempering).
+    Each exchange is accepted with probability min(1, exp((1/T_i - 1/T_j)*(E_i - E_j))).
+    Exchanging the temperatures is equivalent to exchange the structures, but nothing has to be copied.
+
+    Parameters
+    ----------
+    T : np.ndarray
+        Temperatures of the replicas, updated in place.
+    en : np.ndarray
+        Energies of the replicas.
+
+    Returns
+    -------
+    int
+        Number of exchanges accepted.
+    '''
+    order = np.argsort(T) # replicas sorted from the coldest to the hottest
+    accepted = 0
+
+    for k in range(order.shape[0]-1):
+        a = order[k]
+        b = order[k+1]
+        delta = (1/T[a] - 1/T[b])*(en[a] - en[b])
+        if delta >= 0 or np.random.random() < exp(delta):
+            T[a], T[b] = T[b], T[a]
+            order[k], order[k+1] = b, a # the replica a is now the hotter of the pair
+            accepted += 1
+
+    return accepted
+
+
+@njit(cache=True)
+def _set_numba_seed(seed : int) -> None:
+    np.random.seed(seed)
+
+
+def set_seed(seed : int) -> None:
+    '''
+    Set the random seed of the python random module and of the random generator used inside the compiled (numba)
+    functions, which is independent from the python one.
+
+    Parameters
+    ----------
+    seed : int
+        The random seed.
+
+    Returns
+    -------
+    None
+    '''
+    random.seed(seed)
+    _set_numba_seed(seed)
+
+
 def hp_sequence_transform(seq : str) -> str :
     '''
     Transform a compleate sequence of 20 amino-acids into the HP sequence used in the code as model.
@@ -209,20 +723,12 @@ def hp_sequence_transform(seq : str) -> str :
         The sequence converted into only H/P.  
     '''
 
-    polar = 'RNDQEHKST' # polar amino acids 
-    hydr = 'ACGILMFPWYV' # hydrophobic amino acids
+    hp = HP_TABLE[np.frombuffer(seq.encode('ascii', errors='replace'), dtype=np.uint8)] # each letter (byte) mapped to H/P, 0 if not an amino acid
+    wrong = np.flatnonzero(hp == 0)
+    if wrong.size > 0:
+        raise ValueError(f'Amino acids {seq[wrong[0]]} not recognized')
 
-    hp_seq ='' # string where to save the hp sequence
-
-    for amin in seq:
-        if amin in polar:
-            hp_seq += 'P'
-        elif amin in hydr:
-            hp_seq += 'H'
-        else:
-            raise ValueError(f'Amino acids {amin} not recognized')
-    
-    return hp_seq
+    return hp.tobytes().decode('ascii')
 
 
 def progress_bar(progress : int, total : int) -> None:
@@ -273,6 +779,15 @@ class Configuration():
             struct = config['optional']['structure'] # structure if TRUE in input file
             self.struct = json.loads(struct)
         self.gif = config['optional'].getboolean('create_gif')
+        self.local_prob = config['optional'].getfloat('local_move_prob', fallback=0.5) # probability to try a local move instead of a pivot
+        self.crank_prob = config['optional'].getfloat('crankshaft_prob', fallback=0.5) # probability of the crankshaft when also the diagonal move is possible
+        if not (0 <= self.local_prob < 1 and 0 <= self.crank_prob <= 1): # with only local moves a linear structure could never be folded
+            raise ValueError('local_move_prob must be in [0,1) and crankshaft_prob in [0,1]')
+        self.pt = config['optional'].getboolean('parallel_tempering', fallback=False) # if use parallel tempering instead of the single evolution
+        self.pt_temps = json.loads(config['optional'].get('pt_temperatures', fallback='[0.5, 1.0, 1.5, 2.0]')) # temperatures of the replicas
+        self.pt_swap_interval = config['optional'].getint('pt_swap_interval', fallback=100) # steps between two exchange attempts
+        if self.pt and (len(self.pt_temps) < 2 or min(self.pt_temps) <= 0 or self.pt_swap_interval < 1):
+            raise ValueError('pt_temperatures must have at least 2 positive temperatures and pt_swap_interval must be positive')
         self.seed = config['random_seed']['seed'] # get the random seed
         if self.seed == 'None': # generate a random seed if None
             self.seed = random.randint(0,10000)